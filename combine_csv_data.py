@@ -3,6 +3,10 @@
 
 import pandas as pd
 import os
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from cta_memory import MemoryTracker
 
 # File paths
 data_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,59 +19,111 @@ ridership_file = os.path.join(data_dir, 'Ridership.csv')
 # Output file
 combined_file = os.path.join(data_dir, 'CTA_Combined_Data.csv')
 
-def combine_csv_files():
+# Output directory for the partitioned layout (Year=YYYY/Color=<line>/part.csv)
+partitioned_dir = os.path.join(data_dir, 'CTA_Combined_Data')
+
+def write_partitioned(combined_df, output_dir, workers=4):
+    """Write the combined data as one CSV per year and line color, in parallel"""
+    if 'Ride_Date' in combined_df.columns:
+        years = combined_df['Ride_Date'].dt.strftime('%Y').fillna('unknown')
+    else:
+        years = pd.Series('unknown', index=combined_df.index)
+    if 'Color' in combined_df.columns:
+        colors = combined_df['Color'].fillna('unknown').astype(str)
+    else:
+        colors = pd.Series('unknown', index=combined_df.index)
+    
+    # Start from an empty directory so no stale partitions are left behind
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    
+    partitions = combined_df.groupby([years.to_numpy(), colors.to_numpy()], sort=True, dropna=False).indices
+    
+    def write_partition(item):
+        (year, color), positions = item
+        partition_dir = os.path.join(output_dir, f'Year={year}', f'Color={color}')
+        os.makedirs(partition_dir, exist_ok=True)
+        combined_df.iloc[positions].to_csv(os.path.join(partition_dir, 'part.csv'), index=False)
+        return len(positions)
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = sum(pool.map(write_partition, partitions.items()))
+    
+    # Every row must land in exactly one partition
+    if rows != len(combined_df):
+        raise RuntimeError(f"Partitioned output has {rows} rows, expected {len(combined_df)}")
+    
+    print(f"Wrote {rows} rows to {len(partitions)} partitions under {output_dir}")
+
+def combine_csv_files(tracker=None, partitioned=False, workers=4):
     """Combine all CSV files into a single comprehensive dataset"""
+    if tracker is None:
+        tracker = MemoryTracker()
     print("Loading CSV files...")
     
     try:
         # Load each CSV file
-        lines_df = pd.read_csv(lines_file)
-        stations_df = pd.read_csv(stations_file)
-        stops_df = pd.read_csv(stops_file)
-        stop_details_df = pd.read_csv(stop_details_file)
+        with tracker.stage('load network CSVs'):
+            lines_df = pd.read_csv(lines_file)
+            stations_df = pd.read_csv(stations_file)
+            stops_df = pd.read_csv(stops_file)
+            stop_details_df = pd.read_csv(stop_details_file)
         
         # Check if ridership file exists and load it
         ridership_exists = os.path.exists(ridership_file)
         if ridership_exists:
-            ridership_df = pd.read_csv(ridership_file)
+            with tracker.stage('load ridership CSV'):
+                ridership_df = pd.read_csv(ridership_file)
         
         print("All files loaded successfully!")
         
         # Convert IDs to string to ensure proper joining
-        for df in [lines_df, stations_df, stops_df, stop_details_df]:
-            id_columns = [col for col in df.columns if 'ID' in col or 'Id' in col]
-            for col in id_columns:
-                df[col] = df[col].astype(str)
-        
-        if ridership_exists:
-            id_columns = [col for col in ridership_df.columns if 'ID' in col or 'Id' in col]
-            for col in id_columns:
-                ridership_df[col] = ridership_df[col].astype(str)
+        with tracker.stage('convert IDs'):
+            for df in [lines_df, stations_df, stops_df, stop_details_df]:
+                id_columns = [col for col in df.columns if 'ID' in col or 'Id' in col]
+                for col in id_columns:
+                    df[col] = df[col].astype(str)
+            
+            if ridership_exists:
+                id_columns = [col for col in ridership_df.columns if 'ID' in col or 'Id' in col]
+                for col in id_columns:
+                    ridership_df[col] = ridership_df[col].astype(str)
         
         # Combine the data
         print("Combining data...")
         
         # First, join stops with stations to get station names
-        combined_df = pd.merge(stops_df, stations_df, on='Station_ID', how='left')
+        with tracker.stage('merge stations'):
+            combined_df = pd.merge(stops_df, stations_df, on='Station_ID', how='left')
         
         # Then, join with stop_details to get line information
-        combined_df = pd.merge(combined_df, stop_details_df, on='Stop_ID', how='left')
+        with tracker.stage('merge stop details'):
+            combined_df = pd.merge(combined_df, stop_details_df, on='Stop_ID', how='left')
         
         # Finally, join with lines to get line colors
-        combined_df = pd.merge(combined_df, lines_df, on='Line_ID', how='left')
+        with tracker.stage('merge lines'):
+            combined_df = pd.merge(combined_df, lines_df, on='Line_ID', how='left')
         
         # If ridership data exists, join it as well
         if ridership_exists:
             # Convert date column if it exists
             if 'Ride_Date' in ridership_df.columns:
-                ridership_df['Ride_Date'] = pd.to_datetime(ridership_df['Ride_Date'], errors='coerce')
+                with tracker.stage('parse ridership dates'):
+                    ridership_df['Ride_Date'] = pd.to_datetime(ridership_df['Ride_Date'], errors='coerce')
             
             # Join ridership data
-            combined_df = pd.merge(combined_df, ridership_df, on='Station_ID', how='left')
+            with tracker.stage('merge ridership'):
+                combined_df = pd.merge(combined_df, ridership_df, on='Station_ID', how='left')
         
-        # Save the combined data to a CSV file
-        print(f"Saving combined data to {combined_file}...")
-        combined_df.to_csv(combined_file, index=False)
+        # Save the combined data to a CSV file, or one file per year and line
+        if partitioned:
+            print(f"Saving partitioned combined data to {partitioned_dir}...")
+            with tracker.stage('save partitions'):
+                write_partitioned(combined_df, partitioned_dir, workers=workers)
+        else:
+            print(f"Saving combined data to {combined_file}...")
+            with tracker.stage('save combined CSV'):
+                combined_df.to_csv(combined_file, index=False)
         
         print(f"Combined data saved successfully! Total rows: {len(combined_df)}")
         print(f"Columns in combined dataset: {', '.join(combined_df.columns)}")
@@ -80,14 +136,25 @@ def combine_csv_files():
 
 def main():
     """Main function to run the CSV combiner"""
+    parser = argparse.ArgumentParser(description='CTA Tracker - CSV Combiner')
+    parser.add_argument('--memory', action='store_true',
+                        help='record peak RSS and top allocators for each stage')
+    parser.add_argument('--partitioned', action='store_true',
+                        help='write one CSV per year and line color instead of a single file')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='threads used to write partitions (default: 4)')
+    args = parser.parse_args()
+    
     print("CTA Tracker - CSV Combiner")
     print("==========================")
     
-    success = combine_csv_files()
+    tracker = MemoryTracker(enabled=args.memory)
+    success = combine_csv_files(tracker, partitioned=args.partitioned, workers=args.workers)
+    tracker.report()
     
     if success:
         print("\nAll CSV files have been successfully combined into a single dataset!")
-        print(f"The combined file is located at: {combined_file}")
+        print(f"The combined data is located at: {partitioned_dir if args.partitioned else combined_file}")
     else:
         print("\nFailed to combine CSV files. Please check the error messages above.")
 
@@ -5,7 +5,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from cta_network import TransitNetwork
+from cta_memory import MemoryTracker
+from cta_sketches import HyperLogLog, QuantileSketch
 
 # Create output directory for saving plots
 output_dir = 'output_plots'
@@ -21,13 +27,78 @@ plt.rcParams['figure.figsize'] = (12, 8)
 
 # File path
 data_file = 'CTA_Combined_Data.csv'
+partitioned_dir = 'CTA_Combined_Data'
+network_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Check if file exists
-if not os.path.exists(data_file):
-    print(f"Error: {data_file} not found.")
-    exit(1)
 
-print(f"Loading data from {data_file}...")
+#############################################################
+# 0. Data Loading
+#############################################################
+
+# Partitioned layout written by combine_csv_data.py --partitioned:
+# CTA_Combined_Data/Year=YYYY/Color=<line>/part.csv
+
+def parse_years(text):
+    """Parse a year selection like '2022-2023' or '2019,2021' into a set of years"""
+    years = set()
+    for part in text.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            years.update(range(int(first), int(last) + 1))
+        elif part:
+            years.add(int(part))
+    return years
+
+def list_partitions(root, years=None, lines=None):
+    """Partition files under root that match the requested years and lines"""
+    files = []
+    total = 0
+    for year_dir in sorted(os.listdir(root)):
+        key, _, year = year_dir.partition('=')
+        if key != 'Year':
+            continue
+        for color_dir in sorted(os.listdir(os.path.join(root, year_dir))):
+            key, _, color = color_dir.partition('=')
+            if key != 'Color':
+                continue
+            partition_dir = os.path.join(root, year_dir, color_dir)
+            names = sorted(name for name in os.listdir(partition_dir) if name.endswith('.csv'))
+            total += len(names)
+            if years is not None and (not year.isdigit() or int(year) not in years):
+                continue
+            if lines is not None and color not in lines:
+                continue
+            files.extend(os.path.join(partition_dir, name) for name in names)
+    print(f"Reading {len(files)} of {total} partitions from {root}")
+    return files
+
+def filter_rows(df, years=None, lines=None):
+    """Apply year/line filters to rows read from an unpartitioned file"""
+    if years is not None and 'Ride_Date' in df.columns:
+        df = df[pd.to_datetime(df['Ride_Date'], errors='coerce').dt.year.isin(years)]
+    if lines is not None and 'Color' in df.columns:
+        df = df[df['Color'].isin(lines)]
+    return df
+
+def iter_data_chunks(source, chunksize=500000, years=None, lines=None):
+    """Yield the combined data in chunks from a CSV file or a partitioned directory"""
+    if os.path.isdir(source):
+        for path in list_partitions(source, years, lines):
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                yield chunk
+    else:
+        for chunk in pd.read_csv(source, chunksize=chunksize):
+            yield filter_rows(chunk, years, lines)
+
+def load_data(source, years=None, lines=None):
+    """Load the combined data, reading only matching partitions when partitioned"""
+    if os.path.isdir(source):
+        files = list_partitions(source, years, lines)
+        if not files:
+            return pd.DataFrame()
+        return pd.concat([pd.read_csv(path) for path in files], ignore_index=True)
+    return filter_rows(pd.read_csv(source), years, lines)
 
 #############################################################
 # 1. Data Understanding
@@ -81,72 +152,81 @@ def understand_variables(df):
         if unique_values < 10:  # Only show if there are few unique values
             print(f"    Values: {df[col].unique()}")
 
+# Streaming profile for combined files that don't fit in memory
+
+def profile_data_streaming(path, chunksize=500000, years=None, lines=None):
+    """Profile a CSV in chunks: nulls, numeric stats, quantiles and distinct counts in one pass"""
+    print(f"\nStreaming profile of {path} (chunksize={chunksize:,}):")
+    start = time.perf_counter()
+
+    rows = 0
+    nulls = None
+    numeric = {}
+    distinct = {}
+    small_values = {}
+
+    for chunk in iter_data_chunks(path, chunksize, years, lines):
+        rows += len(chunk)
+        chunk_nulls = chunk.isnull().sum()
+        nulls = chunk_nulls if nulls is None else nulls.add(chunk_nulls, fill_value=0)
+
+        numeric_cols = chunk.select_dtypes(include=['int64', 'float64']).columns
+        for col in numeric_cols:
+            values = chunk[col].to_numpy(dtype=np.float64)
+            valid = values[~np.isnan(values)]
+            stats = numeric.setdefault(col, {'count': 0, 'sum': 0.0, 'min': np.inf,
+                                             'max': -np.inf, 'sketch': QuantileSketch()})
+            if len(valid) > 0:
+                stats['count'] += len(valid)
+                stats['sum'] += valid.sum()
+                stats['min'] = min(stats['min'], valid.min())
+                stats['max'] = max(stats['max'], valid.max())
+                stats['sketch'].update(valid)
+
+        for col in chunk.columns:
+            distinct.setdefault(col, HyperLogLog()).update(chunk[col])
+            # Track actual values only while a column still has few of them
+            seen = small_values.setdefault(col, set())
+            if seen is not None:
+                seen.update(chunk[col].dropna().unique().tolist())
+                if len(seen) >= 10:
+                    small_values[col] = None
+
+    elapsed = time.perf_counter() - start
+    print(f"\nRows: {rows:,} ({elapsed:.2f} s, {rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if nulls is None:
+        print("No data found.")
+        return
+
+    print("\nMissing values:")
+    missing = nulls[nulls > 0]
+    if len(missing) == 0:
+        print("No missing values found.")
+    for col, count in missing.items():
+        print(f"  - {col}: {int(count):,} ({count / rows * 100:.2f}%)")
+
+    print("\nNumeric variables summary (quantiles approximate):")
+    for col, stats in numeric.items():
+        if stats['count'] == 0:
+            continue
+        q25, q50, q75 = stats['sketch'].quantiles([0.25, 0.5, 0.75])
+        print(f"  - {col}: count={stats['count']:,} mean={stats['sum'] / stats['count']:.4f} "
+              f"min={stats['min']} 25%={q25} 50%={q50} 75%={q75} max={stats['max']}")
+
+    print("\nDistinct values (approximate):")
+    for col, hll in distinct.items():
+        print(f"  - {col}: ~{hll.count():,} unique values")
+        if small_values[col] is not None:
+            print(f"    Values: {sorted(small_values[col], key=str)}")
+
 #############################################################
 # 2. Data Cleaning
 #############################################################
 
-def handle_missing_values(df):
-    """Handle missing values in the dataset"""
-    print("\n1. Handling Missing Values:")
-    
-    # Check if there are any missing values
-    if df.isnull().sum().sum() == 0:
-        print("No missing values to handle.")
-        return df
-    
-    # For numeric columns, fill with median
-    numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns
-    for col in numeric_cols:
-        if df[col].isnull().sum() > 0:
-            median_value = df[col].median()
-            df[col] = df[col].fillna(median_value)
-            print(f"  - Filled missing values in {col} with median: {median_value}")
-    
-    # For categorical columns, fill with mode
-    cat_cols = df.select_dtypes(include=['object']).columns
-    for col in cat_cols:
-        if df[col].isnull().sum() > 0:
-            mode_value = df[col].mode()[0]
-            df[col] = df[col].fillna(mode_value)
-            print(f"  - Filled missing values in {col} with mode: {mode_value}")
-    
-    return df
-
-def fix_data_types(df):
-    """Fix data types in the dataset"""
-    print("\n2. Fixing Data Types:")
-    
-    # Convert ID columns to string if they're not already
-    id_columns = [col for col in df.columns if 'ID' in col or 'Id' in col]
-    for col in id_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str)
-            print(f"  - Converted {col} to string type")
-    
-    # Convert geographic coordinates to float
-    geo_columns = ['Latitude', 'Longitude']
-    for col in geo_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            print(f"  - Converted {col} to numeric type")
-    
-    # Convert ADA indicator to boolean
-    if 'ADA' in df.columns:
-        df['ADA'] = df['ADA'].astype(bool)
-        print("  - Converted ADA to boolean type")
-    
-    # Convert date columns to datetime
-    date_columns = [col for col in df.columns if 'Date' in col]
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-            print(f"  - Converted {col} to datetime type")
-    
-    return df
-
 def remove_unnecessary_columns(df):
     """Remove unnecessary columns and create derived variables"""
-    print("\n3. Column Management:")
+    print("\n2. Column Management:")
     
     # List all columns
     print("Available columns:")
@@ -163,7 +243,105 @@ def remove_unnecessary_columns(df):
         df['Day'] = df['Ride_Date'].dt.day
         df['DayOfWeek'] = df['Ride_Date'].dt.dayofweek
         print("  - Created date-based derived variables (Year, Month, Day, DayOfWeek)")
-    
+
+    return df
+
+# Cleaning spec for the known CTA columns: target type, how to fill missing
+# values ('median', 'mode' or None) and, for dates, the explicit format the
+# combiner writes so pandas never has to infer it
+CLEANING_SPEC = {
+    'Stop_ID':      {'type': 'str',      'fill': None},
+    'Station_ID':   {'type': 'str',      'fill': None},
+    'Line_ID':      {'type': 'str',      'fill': None},
+    'Stop_Name':    {'type': 'str',      'fill': 'mode'},
+    'Station_Name': {'type': 'str',      'fill': 'mode'},
+    'Direction':    {'type': 'str',      'fill': 'mode'},
+    'Color':        {'type': 'str',      'fill': 'mode'},
+    'Type_of_Day':  {'type': 'str',      'fill': 'mode'},
+    'Latitude':     {'type': 'float',    'fill': 'median'},
+    'Longitude':    {'type': 'float',    'fill': 'median'},
+    'Num_Riders':   {'type': 'float',    'fill': 'median'},
+    'ADA':          {'type': 'bool',     'fill': 'mode'},
+    'Ride_Date':    {'type': 'datetime', 'fill': None, 'format': '%Y-%m-%d'},
+}
+
+def _mode_of_codes(codes, uniques):
+    """Most frequent value given factorized codes (scales with distinct values)"""
+    valid = codes[codes >= 0]
+    if len(valid) == 0:
+        return None
+    return uniques[np.bincount(valid).argmax()]
+
+def _parse_dates(series, date_format=None):
+    """Parse a date column by converting each distinct value only once"""
+    codes, uniques = pd.factorize(series)
+    parsed = pd.to_datetime(pd.Series(uniques), format=date_format, errors='coerce')
+    if date_format is not None and parsed.isnull().all() and len(uniques) > 0:
+        # Values don't match the known format, fall back to inference
+        parsed = pd.to_datetime(pd.Series(uniques), errors='coerce')
+    values = parsed.to_numpy()
+    result = np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+    mask = codes >= 0
+    result[mask] = values[codes[mask]]
+    return pd.Series(result, index=series.index, name=series.name)
+
+def _clean_column(df, col, rules, null_count, log):
+    """Convert and fill a single column in place according to its spec entry"""
+    col_type = rules['type']
+    fill = rules.get('fill')
+
+    if col_type == 'datetime':
+        df[col] = _parse_dates(df[col], rules.get('format'))
+    elif col_type == 'float':
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    if col_type in ('datetime', 'float'):
+        # Values that failed to convert are now missing too
+        null_count = df[col].isnull().sum()
+
+    if fill is not None and null_count > 0:
+        if fill == 'median':
+            fill_value = df[col].median()
+        else:
+            codes, uniques = pd.factorize(df[col])
+            fill_value = _mode_of_codes(codes, uniques)
+        if fill_value is not None:
+            df[col] = df[col].fillna(fill_value)
+            log(f"  - Filled {null_count} missing values in {col} with {fill}: {fill_value}")
+
+    if col_type == 'str':
+        # Cast the distinct values only, then map back onto the rows
+        codes, uniques = pd.factorize(df[col])
+        as_str = np.append(np.asarray(uniques, dtype=object).astype(str), 'nan').astype(object)
+        df[col] = pd.Series(as_str[codes], index=df.index)
+    elif col_type == 'bool':
+        df[col] = df[col].astype(bool)
+
+def apply_cleaning_spec(df, spec=CLEANING_SPEC, verbose=True, tracker=None):
+    """Fill missing values and fix data types for every column in one pass"""
+    log = print if verbose else (lambda *args, **kwargs: None)
+    if tracker is None:
+        tracker = MemoryTracker()
+    log("\n1. Cleaning Spec:")
+
+    # A single vectorized null count instead of one per column
+    null_counts = df.isnull().sum()
+    timings = {}
+
+    for col, rules in spec.items():
+        if col not in df.columns:
+            continue
+        with tracker.stage(f'clean {col}'):
+            # Timed inside the stage so tracker snapshots aren't counted
+            start = time.perf_counter()
+            _clean_column(df, col, rules, null_counts[col], log)
+            timings[col] = time.perf_counter() - start
+        log(f"  - {col} -> {rules['type']} ({timings[col] * 1000:.1f} ms)")
+
+    skipped = [col for col in df.columns if col not in spec]
+    if skipped:
+        log(f"  - Columns not in spec left unchanged: {', '.join(skipped)}")
+    log(f"  Total cleaning time: {sum(timings.values()):.3f} s")
+
     return df
 
 #############################################################
@@ -216,6 +394,171 @@ def univariate_analysis(df):
             print(f"Saved plot to {filename}")
             plt.close()
 
+# Plot helpers shared by the in-memory and out-of-core analyses. Each takes an
+# already aggregated Series/DataFrame so the aggregation step can be swapped.
+
+def plot_top_stations(station_ridership):
+    """Print and plot the top 10 stations by ridership"""
+    print("\nRidership by Station:")
+    print(station_ridership.head(10))
+    
+    # Plot top 10 stations by ridership
+    plt.figure(figsize=(12, 8))
+    station_ridership.head(10).sort_values().plot(kind='barh')
+    plt.title('Top 10 Stations by Ridership')
+    plt.xlabel('Number of Riders')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/bivariate_top10_stations.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+def plot_day_type(day_type_ridership):
+    """Print and plot ridership by day type"""
+    print("\nRidership by Day Type:")
+    print(day_type_ridership)
+    
+    # Plot ridership by day type
+    plt.figure()
+    day_type_ridership.plot(kind='bar')
+    plt.title('Ridership by Day Type')
+    plt.xlabel('Day Type (W=Weekday, A=Saturday, U=Sunday/Holiday)')
+    plt.ylabel('Number of Riders')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/bivariate_day_type.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+def plot_month(month_ridership):
+    """Print and plot ridership by month"""
+    print("\nRidership by Month:")
+    print(month_ridership)
+    
+    # Plot ridership by month
+    plt.figure()
+    month_ridership.plot(kind='line', marker='o')
+    plt.title('Ridership by Month')
+    plt.xlabel('Month')
+    plt.ylabel('Number of Riders')
+    plt.xticks(range(1, 13))
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/bivariate_month_ridership.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+def plot_station_day_type(station_day_ridership, station_ridership):
+    """Print and plot the station by day type heatmap for the top 10 stations"""
+    print("\nRidership by Station and Day Type:")
+    print(station_day_ridership.head(10))
+    
+    # Plot heatmap of top 10 stations by day type
+    plt.figure(figsize=(12, 8))
+    top_stations = station_ridership.nlargest(10).index
+    heatmap_data = station_day_ridership.loc[station_day_ridership.index.isin(top_stations)]
+    sns.heatmap(heatmap_data, annot=True, fmt='.0f', cmap='viridis')
+    plt.title('Ridership by Station and Day Type (Top 10 Stations)')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/multivariate_station_day_type.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+def plot_year_month(year_month_ridership):
+    """Print and plot the year by month heatmap"""
+    print("\nRidership by Year and Month:")
+    print(year_month_ridership)
+    
+    # Plot heatmap of ridership by year and month
+    plt.figure(figsize=(12, 8))
+    sns.heatmap(year_month_ridership, annot=True, fmt='.0f', cmap='viridis')
+    plt.title('Ridership by Year and Month')
+    plt.xlabel('Month')
+    plt.ylabel('Year')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/multivariate_year_month.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+def plot_ada(ada_counts):
+    """Print and plot the proportion of ADA accessible stops"""
+    print("\nAccessibility Analysis:")
+    print(f"Accessible stops: {ada_counts.get(True, 0)}")
+    print(f"Non-accessible stops: {ada_counts.get(False, 0)}")
+    
+    # Plot pie chart of accessibility
+    plt.figure()
+    ada_counts.plot(kind='pie', autopct='%1.1f%%')
+    plt.title('Proportion of ADA Accessible Stops')
+    plt.ylabel('')  # Hide the ylabel
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/domain_ada_accessibility.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+# Create a color map for CTA lines, handling special cases like Purple-Express
+LINE_COLOR_MAP = {
+    'Red': 'red',
+    'Blue': 'blue',
+    'Brown': 'brown',
+    'Green': 'green',
+    'Orange': 'orange',
+    'Pink': 'pink',
+    'Purple': 'purple',
+    'Purple-Express': 'purple',
+    'Yellow': 'yellow'
+}
+
+def plot_line_color(color_ridership):
+    """Print and plot ridership by line color"""
+    print("\nLine Color Analysis:")
+    print(color_ridership)
+    
+    # Plot bar chart of ridership by line color
+    plt.figure()
+    # Get colors for each bar based on line name
+    bar_colors = [LINE_COLOR_MAP.get(color, 'gray') for color in color_ridership.index]
+    
+    color_ridership.plot(kind='bar', color=bar_colors)
+    plt.title('Ridership by Line Color')
+    plt.xlabel('Line Color')
+    plt.ylabel('Number of Riders')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/domain_line_color.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+
+_network = None
+
+def get_network():
+    """Load the transit network index from the source CSVs once, or None if they are missing"""
+    global _network
+    if _network is None:
+        try:
+            _network = TransitNetwork.from_csv(network_dir)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Transit network index unavailable ({e}), using the Color column instead")
+            _network = False
+    return _network or None
+
+def line_color_ridership(station_totals):
+    """Ridership by line color from unfiltered per-station totals using the network index"""
+    network = get_network()
+    if network is None:
+        return None
+    return pd.Series(network.line_ridership(station_totals), dtype='float64').sort_values(ascending=False)
+
 # 3.2 Bivariate Analysis
 def bivariate_analysis(df):
     """Perform bivariate analysis on the dataset"""
@@ -223,60 +566,16 @@ def bivariate_analysis(df):
     
     # Ridership by station
     if 'Station_Name' in df.columns and 'Num_Riders' in df.columns:
-        print("\nRidership by Station:")
         station_ridership = df.groupby('Station_Name')['Num_Riders'].sum().sort_values(ascending=False)
-        print(station_ridership.head(10))
-        
-        # Plot top 10 stations by ridership
-        plt.figure(figsize=(12, 8))
-        station_ridership.head(10).sort_values().plot(kind='barh')
-        plt.title('Top 10 Stations by Ridership')
-        plt.xlabel('Number of Riders')
-        plt.tight_layout()
-        # Save figure to file
-        filename = f"{output_dir}/bivariate_top10_stations.png"
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close()
+        plot_top_stations(station_ridership)
     
     # Ridership by day type
     if 'Type_of_Day' in df.columns and 'Num_Riders' in df.columns:
-        print("\nRidership by Day Type:")
-        day_type_ridership = df.groupby('Type_of_Day')['Num_Riders'].sum()
-        print(day_type_ridership)
-        
-        # Plot ridership by day type
-        plt.figure()
-        day_type_ridership.plot(kind='bar')
-        plt.title('Ridership by Day Type')
-        plt.xlabel('Day Type (W=Weekday, A=Saturday, U=Sunday/Holiday)')
-        plt.ylabel('Number of Riders')
-        plt.tight_layout()
-        # Save figure to file
-        filename = f"{output_dir}/bivariate_day_type.png"
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close()
+        plot_day_type(df.groupby('Type_of_Day')['Num_Riders'].sum())
     
     # Ridership by month
     if 'Month' in df.columns and 'Num_Riders' in df.columns:
-        print("\nRidership by Month:")
-        month_ridership = df.groupby('Month')['Num_Riders'].sum()
-        print(month_ridership)
-        
-        # Plot ridership by month
-        plt.figure()
-        month_ridership.plot(kind='line', marker='o')
-        plt.title('Ridership by Month')
-        plt.xlabel('Month')
-        plt.ylabel('Number of Riders')
-        plt.xticks(range(1, 13))
-        plt.tight_layout()
-        # Save figure to file
-        filename = f"{output_dir}/bivariate_month_ridership.png"
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close()
+        plot_month(df.groupby('Month')['Num_Riders'].sum())
 
 # 3.3 Multivariate Analysis
 def multivariate_analysis(df):
@@ -285,133 +584,533 @@ def multivariate_analysis(df):
     
     # Ridership by station and day type
     if all(col in df.columns for col in ['Station_Name', 'Type_of_Day', 'Num_Riders']):
-        print("\nRidership by Station and Day Type:")
         station_day_ridership = df.groupby(['Station_Name', 'Type_of_Day'])['Num_Riders'].sum().unstack()
-        print(station_day_ridership.head(10))
-        
-        # Plot heatmap of top 10 stations by day type
-        plt.figure(figsize=(12, 8))
-        top_stations = df.groupby('Station_Name')['Num_Riders'].sum().nlargest(10).index
-        heatmap_data = df[df['Station_Name'].isin(top_stations)].pivot_table(
-            index='Station_Name', 
-            columns='Type_of_Day', 
-            values='Num_Riders', 
-            aggfunc='sum'
-        )
-        sns.heatmap(heatmap_data, annot=True, fmt='.0f', cmap='viridis')
-        plt.title('Ridership by Station and Day Type (Top 10 Stations)')
-        plt.tight_layout()
-        # Save figure to file
-        filename = f"{output_dir}/multivariate_station_day_type.png"
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close()
+        station_ridership = df.groupby('Station_Name')['Num_Riders'].sum()
+        plot_station_day_type(station_day_ridership, station_ridership)
     
     # Ridership by year and month (if date columns exist)
     if all(col in df.columns for col in ['Year', 'Month', 'Num_Riders']):
-        print("\nRidership by Year and Month:")
-        year_month_ridership = df.groupby(['Year', 'Month'])['Num_Riders'].sum().unstack()
-        print(year_month_ridership)
-        
-        # Plot heatmap of ridership by year and month
-        plt.figure(figsize=(12, 8))
-        year_month_pivot = df.pivot_table(
-            index='Year', 
-            columns='Month', 
-            values='Num_Riders', 
-            aggfunc='sum'
-        )
-        sns.heatmap(year_month_pivot, annot=True, fmt='.0f', cmap='viridis')
-        plt.title('Ridership by Year and Month')
-        plt.xlabel('Month')
-        plt.ylabel('Year')
-        plt.tight_layout()
-        # Save figure to file
-        filename = f"{output_dir}/multivariate_year_month.png"
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close()
+        plot_year_month(df.groupby(['Year', 'Month'])['Num_Riders'].sum().unstack())
 
 # 3.4 Domain-Specific Analysis
-def domain_specific_analysis(df):
+def domain_specific_analysis(df, lines_filtered=False):
     """Perform domain-specific analysis on the dataset"""
     print("\n3.4 Domain-Specific Analysis:")
     
     # Accessibility analysis
     if 'ADA' in df.columns:
-        print("\nAccessibility Analysis:")
-        ada_counts = df['ADA'].value_counts()
-        print(f"Accessible stops: {ada_counts.get(True, 0)}")
-        print(f"Non-accessible stops: {ada_counts.get(False, 0)}")
-        
-        # Plot pie chart of accessibility
+        plot_ada(df['ADA'].value_counts())
+    
+    # Line color analysis
+    if 'Station_ID' in df.columns and 'Num_Riders' in df.columns:
+        color_ridership = None
+        # Station totals only cover the selected lines once rows are filtered by line,
+        # so the per-station split doesn't apply and the Color column is used instead
+        if not lines_filtered:
+            color_ridership = line_color_ridership(df.groupby('Station_ID')['Num_Riders'].sum())
+        if color_ridership is None and 'Color' in df.columns:
+            color_ridership = df.groupby('Color')['Num_Riders'].sum().sort_values(ascending=False)
+        if color_ridership is not None:
+            plot_line_color(color_ridership)
+
+# 3.5 Out-of-core Analysis
+# Every aggregation above is a sum or a count, so it can be computed per chunk
+# and the partial results added together at the end.
+
+def partial_aggregates(chunk):
+    """Clean one chunk and compute its partial aggregates"""
+    chunk = apply_cleaning_spec(chunk, verbose=False)
+    if 'Ride_Date' in chunk.columns:
+        chunk['Year'] = chunk['Ride_Date'].dt.year
+        chunk['Month'] = chunk['Ride_Date'].dt.month
+    
+    parts = {}
+    if 'Num_Riders' in chunk.columns:
+        riders = chunk['Num_Riders']
+        if 'Station_Name' in chunk.columns:
+            parts['station'] = riders.groupby(chunk['Station_Name']).sum()
+        if 'Type_of_Day' in chunk.columns:
+            parts['day_type'] = riders.groupby(chunk['Type_of_Day']).sum()
+        if 'Station_Name' in chunk.columns and 'Type_of_Day' in chunk.columns:
+            parts['station_day'] = riders.groupby([chunk['Station_Name'], chunk['Type_of_Day']]).sum()
+        if 'Month' in chunk.columns:
+            parts['month'] = riders.groupby(chunk['Month']).sum()
+        if 'Year' in chunk.columns and 'Month' in chunk.columns:
+            parts['year_month'] = riders.groupby([chunk['Year'], chunk['Month']]).sum()
+        if 'Station_ID' in chunk.columns:
+            parts['station_id'] = riders.groupby(chunk['Station_ID']).sum()
+        if 'Color' in chunk.columns:
+            parts['color'] = riders.groupby(chunk['Color']).sum()
+    if 'ADA' in chunk.columns:
+        parts['ada'] = chunk['ADA'].value_counts()
+    return parts
+
+def merge_partial_aggregates(total, parts):
+    """Add one set of partial aggregates into the running total"""
+    for key, part in parts.items():
+        total[key] = part if key not in total else total[key].add(part, fill_value=0)
+    return total
+
+def compute_aggregates_out_of_core(path, chunksize=500000, workers=1, years=None, lines=None):
+    """Compute all analysis aggregates over a CSV in chunks, optionally across a process pool"""
+    print(f"\nComputing aggregates out-of-core from {path} (chunksize={chunksize:,}, workers={workers}):")
+    start = time.perf_counter()
+    total = {}
+    chunks = 0
+    reader = iter_data_chunks(path, chunksize, years, lines)
+    
+    if workers <= 1:
+        for chunk in reader:
+            merge_partial_aggregates(total, partial_aggregates(chunk))
+            chunks += 1
+    else:
+        # Bound the number of chunks in flight so memory stays tied to chunksize
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for chunk in reader:
+                pending.add(pool.submit(partial_aggregates, chunk))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge_partial_aggregates(total, future.result())
+                        chunks += 1
+            for future in pending:
+                merge_partial_aggregates(total, future.result())
+                chunks += 1
+    
+    print(f"  Processed {chunks} chunks in {time.perf_counter() - start:.2f} s")
+    return total
+
+def out_of_core_analysis(path, chunksize=500000, workers=1, years=None, lines=None):
+    """Run the bivariate, multivariate and domain analyses without loading the full dataset"""
+    aggregates = compute_aggregates_out_of_core(path, chunksize=chunksize, workers=workers,
+                                                years=years, lines=lines)
+    
+    print("\n3.2 Bivariate Analysis (out-of-core):")
+    if 'station' in aggregates:
+        plot_top_stations(aggregates['station'].sort_values(ascending=False))
+    if 'day_type' in aggregates:
+        plot_day_type(aggregates['day_type'])
+    if 'month' in aggregates:
+        plot_month(aggregates['month'].sort_index())
+    
+    print("\n3.3 Multivariate Analysis (out-of-core):")
+    if 'station_day' in aggregates:
+        plot_station_day_type(aggregates['station_day'].unstack(), aggregates['station'])
+    if 'year_month' in aggregates:
+        plot_year_month(aggregates['year_month'].unstack())
+    
+    print("\n3.4 Domain-Specific Analysis (out-of-core):")
+    if 'ada' in aggregates:
+        plot_ada(aggregates['ada'])
+    color_ridership = None
+    if lines is None and 'station_id' in aggregates:
+        color_ridership = line_color_ridership(aggregates['station_id'])
+    if color_ridership is None and 'color' in aggregates:
+        color_ridership = aggregates['color'].sort_values(ascending=False)
+    if color_ridership is not None:
+        plot_line_color(color_ridership)
+
+# 3.6 Forecasting
+# Seasonal baseline per station: intercept + linear trend + day type + month.
+# Every station shares the same design matrix over dates, so all stations are
+# fitted together with one batched solve of the (masked) normal equations.
+
+DAY_TYPES = ['W', 'A', 'U']
+
+def _seasonal_design(dates, day_types, start):
+    """Design matrix (days x features) for the seasonal baseline"""
+    dates = pd.DatetimeIndex(dates)
+    trend = np.asarray((dates - start).days, dtype=np.float64) / 365.25
+    columns = [np.ones(len(dates)), trend]
+    day_types = np.asarray(day_types)
+    for day_type in DAY_TYPES[1:]:
+        columns.append((day_types == day_type).astype(np.float64))
+    for month in range(2, 13):
+        columns.append((dates.month == month).astype(np.float64))
+    return np.column_stack(columns)
+
+def _fit_batched(X, Y, ridge=1e-3):
+    """Least squares for every row of Y (stations x days) at once, ignoring NaNs"""
+    mask = ~np.isnan(Y)
+    Y0 = np.where(mask, Y, 0.0)
+    M = mask.astype(np.float64)
+    # Per-station normal equations: (X' W X) b = X' W y with W = observed days
+    gram = np.einsum('sd,dk,dl->skl', M, X, X)
+    rhs = Y0 @ X
+    gram += ridge * np.eye(X.shape[1])
+    return np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+def _day_type_for(dates):
+    """Day type from the calendar (holidays are not known ahead of time)"""
+    weekday = pd.DatetimeIndex(dates).dayofweek
+    return np.where(weekday == 5, 'A', np.where(weekday == 6, 'U', 'W'))
+
+def forecast_next_month(df, min_days=60):
+    """Fit a seasonal baseline for all stations, backtest it and forecast next month's ridership"""
+    print("\n3.6 Next-Month Ridership Forecast:")
+    
+    if not all(col in df.columns for col in ['Station_ID', 'Ride_Date', 'Type_of_Day', 'Num_Riders']):
+        print("Forecast needs Station_ID, Ride_Date, Type_of_Day and Num_Riders columns.")
+        return None
+    
+    # The combined dataset repeats each daily row per stop/line, keep one per station and day
+    daily = df.dropna(subset=['Ride_Date']).drop_duplicates(['Station_ID', 'Ride_Date'])
+    Y_frame = daily.pivot(index='Station_ID', columns='Ride_Date', values='Num_Riders')
+    dates = Y_frame.columns
+    day_types = daily.groupby('Ride_Date')['Type_of_Day'].first().reindex(dates).to_numpy()
+    Y = Y_frame.to_numpy(dtype=np.float64)
+    enough = (~np.isnan(Y)).sum(axis=1) >= min_days
+    Y, station_ids = Y[enough], Y_frame.index[enough]
+    print(f"  Stations: {len(station_ids)}, days: {len(dates)}")
+    if len(station_ids) == 0:
+        print("Not enough data to fit a forecast.")
+        return None
+    
+    start = dates.min()
+    X = _seasonal_design(dates, day_types, start)
+    
+    # Backtest: fit on everything before the last month, predict that month
+    last_period = dates.max().to_period('M')
+    holdout = np.asarray(dates.to_period('M') == last_period)
+    if (~holdout).sum() < min_days:
+        print(f"  Not enough history before {last_period} to backtest.")
+    else:
+        fit_start = time.perf_counter()
+        coef = _fit_batched(X[~holdout], Y[:, ~holdout])
+        backtest_time = time.perf_counter() - fit_start
+        predicted = coef @ X[holdout].T
+        actual = Y[:, holdout]
+        observed = ~np.isnan(actual)
+        abs_error = np.abs(np.where(observed, predicted - actual, 0.0))
+        actual_total = np.where(observed, actual, 0.0).sum(axis=1)
+        predicted_total = np.where(observed, predicted, 0.0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            monthly_ape = np.abs(predicted_total - actual_total) / actual_total
+        print(f"  Backtest on {last_period} ({holdout.sum()} days), fitted in {backtest_time * 1000:.1f} ms:")
+        print(f"    Daily MAE: {abs_error.sum() / max(observed.sum(), 1):,.1f} riders")
+        print(f"    Daily WAPE: {abs_error.sum() / max(actual_total.sum(), 1) * 100:.2f}%")
+        finite_ape = monthly_ape[np.isfinite(monthly_ape)]
+        if len(finite_ape) > 0:
+            print(f"    Median station monthly error: {np.median(finite_ape) * 100:.2f}%")
+    
+    # Refit on all data and forecast the following month
+    fit_start = time.perf_counter()
+    coef = _fit_batched(X, Y)
+    fit_time = time.perf_counter() - fit_start
+    next_period = last_period + 1
+    future_dates = pd.date_range(next_period.start_time, next_period.end_time.normalize(), freq='D')
+    forecast = coef @ _seasonal_design(future_dates, _day_type_for(future_dates), start).T
+    print(f"  Fitted {len(station_ids)} stations in {fit_time * 1000:.1f} ms")
+    
+    names = daily.drop_duplicates('Station_ID').set_index('Station_ID')['Station_Name'] \
+        if 'Station_Name' in daily.columns else pd.Series(dtype=object)
+    result = pd.DataFrame({
+        'Station_ID': station_ids,
+        'Station_Name': names.reindex(station_ids).to_numpy(),
+        'Forecast_Riders': np.clip(forecast, 0, None).sum(axis=1).round(),
+    }).sort_values('Forecast_Riders', ascending=False)
+    
+    print(f"\nForecast ridership for {next_period} (top 10 stations):")
+    print(result.head(10).to_string(index=False))
+    print(f"Total forecast ridership: {result['Forecast_Riders'].sum():,.0f}")
+    
+    filename = f"{output_dir}/forecast_next_month.csv"
+    result.to_csv(filename, index=False)
+    print(f"Saved forecast to {filename}")
+    
+    # Plot top 10 stations by forecast ridership
+    plt.figure(figsize=(12, 8))
+    result.head(10).set_index('Station_Name')['Forecast_Riders'].sort_values().plot(kind='barh')
+    plt.title(f'Forecast Ridership for {next_period} (Top 10 Stations)')
+    plt.xlabel('Number of Riders')
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/forecast_top10_stations.png"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
+    
+    return result
+
+# 3.7 Preview Analysis
+# Runs the exploratory views on a reproducible sample taken while the data
+# streams in. Each sampled row carries a weight N_h / n_h for its stratum h
+# (station x day type), so sums are scaled up to estimated totals and come
+# with a 95% confidence interval.
+
+def _strata_keys(df):
+    """Stratum label per row: station and day type"""
+    keys = pd.Series('all', index=df.index)
+    # astype(str) keeps NaN on newer pandas, which would drop rows from every stratum
+    if 'Station_Name' in df.columns:
+        keys = df['Station_Name'].astype(str).fillna('unknown')
+    if 'Type_of_Day' in df.columns:
+        keys = keys + '|' + df['Type_of_Day'].astype(str).fillna('unknown')
+    return keys
+
+def stratified_sample(source, frac=0.05, chunksize=500000, seed=0, years=None, lines=None):
+    """Bernoulli sample of each stratum while streaming, with post-stratified weights"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    seen = set()
+    population = None
+    rows = 0
+    for chunk in iter_data_chunks(source, chunksize, years, lines):
+        rows += len(chunk)
+        keys = _strata_keys(chunk)
+        counts = keys.value_counts()
+        population = counts if population is None else population.add(counts, fill_value=0)
+        keep = rng.random(len(chunk)) < frac
+        # Keep at least one row of every stratum so no stratum drops out of the estimates
+        keep |= (~keys.duplicated() & ~keys.isin(seen)).to_numpy()
+        seen.update(keys[keep].unique())
+        sample = chunk[keep].copy()
+        sample['_stratum'] = keys[keep]
+        samples.append(sample)
+    if not samples:
+        return pd.DataFrame()
+    # Every row read must belong to exactly one stratum
+    if int(population.sum()) != rows:
+        raise RuntimeError(f"Strata cover {int(population.sum())} rows, expected {rows}")
+    
+    sample = pd.concat(samples, ignore_index=True)
+    sampled = sample['_stratum'].value_counts()
+    sample['_population'] = sample['_stratum'].map(population).to_numpy()
+    sample['_weight'] = sample['_population'] / sample['_stratum'].map(sampled).to_numpy()
+    print(f"Stratified sample: {len(sample):,} of {int(population.sum()):,} rows "
+          f"({len(population)} strata, frac={frac})")
+    return sample
+
+def reservoir_sample(source, size=100000, chunksize=500000, seed=0, years=None, lines=None):
+    """Uniform sample of a fixed size while streaming (bottom-k random keys)"""
+    rng = np.random.default_rng(seed)
+    sample = None
+    rows = 0
+    for chunk in iter_data_chunks(source, chunksize, years, lines):
+        rows += len(chunk)
+        chunk = chunk.assign(_key=rng.random(len(chunk)))
+        sample = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        sample = sample.nsmallest(size, '_key')
+    if sample is None:
+        return pd.DataFrame()
+    
+    sample = sample.drop(columns='_key').reset_index(drop=True)
+    sample['_stratum'] = 'all'
+    sample['_population'] = rows
+    sample['_weight'] = rows / len(sample)
+    print(f"Reservoir sample: {len(sample):,} of {rows:,} rows")
+    return sample
+
+def estimate_totals(sample, by, value='Num_Riders'):
+    """Estimated group totals of value with standard errors from a weighted sample.
+
+    Pass the whole sample: rows outside a group (including rows with a
+    missing group key) still count towards their stratum's sample size.
+    """
+    y = sample[value].astype(float)
+    parts = pd.DataFrame({'_stratum': sample['_stratum'], 'y': y, 'y2': y ** 2})
+    for col in by:
+        parts[col] = sample[col].to_numpy()
+    sums = parts.groupby(by + ['_stratum'])[['y', 'y2']].sum().reset_index()
+    
+    strata = sample.groupby('_stratum').agg(n=('_weight', 'size'), N=('_population', 'first'))
+    sums = sums.join(strata, on='_stratum')
+    # Per stratum, z = y for rows in the group and 0 otherwise
+    mean = sums['y'] / sums['n']
+    var = (sums['y2'] - sums['n'] * mean ** 2) / (sums['n'] - 1).clip(lower=1)
+    fpc = 1 - sums['n'] / sums['N']
+    sums['estimate'] = sums['N'] * mean
+    sums['variance'] = sums['N'] ** 2 * fpc * var.clip(lower=0) / sums['n']
+    
+    totals = sums.groupby(by)[['estimate', 'variance']].sum()
+    totals['stderr'] = np.sqrt(totals['variance'])
+    return totals.drop(columns='variance')
+
+def _print_estimates(totals):
+    for key, row in totals.iterrows():
+        margin = 1.96 * row['stderr']
+        relative = margin / row['estimate'] * 100 if row['estimate'] else np.nan
+        print(f"  {key}: {row['estimate']:,.0f} ± {margin:,.0f} ({relative:.1f}%)")
+
+def preview_analysis(source, frac=0.05, size=None, chunksize=500000, seed=0, years=None, lines=None):
+    """Fast approximate preview of the univariate, top-station and heatmap views"""
+    print("\n3.7 Preview Analysis (approximate):")
+    start = time.perf_counter()
+    if size is not None:
+        sample = reservoir_sample(source, size=size, chunksize=chunksize, seed=seed, years=years, lines=lines)
+    else:
+        sample = stratified_sample(source, frac=frac, chunksize=chunksize, seed=seed, years=years, lines=lines)
+    if len(sample) == 0:
+        print("No data to preview.")
+        return
+    
+    sample = apply_cleaning_spec(sample, verbose=False)
+    if 'Ride_Date' in sample.columns:
+        sample['Year'] = sample['Ride_Date'].dt.year
+        sample['Month'] = sample['Ride_Date'].dt.month
+    weights = sample['_weight']
+    
+    # Weighted histograms of the numeric variables
+    numeric_cols = [col for col in sample.select_dtypes(include=['int64', 'float64', 'int32']).columns
+                    if not col.startswith('_') and (col == 'Num_Riders' or 'ID' not in col)]
+    for col in numeric_cols:
         plt.figure()
-        ada_counts.plot(kind='pie', autopct='%1.1f%%')
-        plt.title('Proportion of ADA Accessible Stops')
-        plt.ylabel('')  # Hide the ylabel
+        sns.histplot(x=sample[col], weights=weights)
+        plt.title(f'Distribution of {col} (preview, estimated counts)')
         plt.tight_layout()
         # Save figure to file
-        filename = f"{output_dir}/domain_ada_accessibility.png"
+        filename = f"{output_dir}/preview_univariate_numeric_{col}.png"
         plt.savefig(filename)
         print(f"Saved plot to {filename}")
         plt.close()
     
-    # Line color analysis
-    if 'Color' in df.columns and 'Num_Riders' in df.columns:
-        print("\nLine Color Analysis:")
-        color_ridership = df.groupby('Color')['Num_Riders'].sum().sort_values(ascending=False)
-        print(color_ridership)
-        
-        # Plot bar chart of ridership by line color
-        plt.figure()
-        # Create a color map for CTA lines, handling special cases like Purple-Express
-        color_map = {
-            'Red': 'red',
-            'Blue': 'blue',
-            'Brown': 'brown',
-            'Green': 'green',
-            'Orange': 'orange',
-            'Pink': 'pink',
-            'Purple': 'purple',
-            'Purple-Express': 'purple',
-            'Yellow': 'yellow'
-        }
-        # Get colors for each bar based on line name
-        bar_colors = [color_map.get(color, 'gray') for color in color_ridership.index]
+    if 'Num_Riders' not in sample.columns:
+        print(f"\nPreview complete in {time.perf_counter() - start:.2f} s")
+        return
+    
+    # Top 10 stations with 95% confidence intervals
+    if 'Station_Name' in sample.columns:
+        station_totals = estimate_totals(sample, ['Station_Name']).sort_values('estimate', ascending=False)
+        top = station_totals.head(10)
+        print("\nEstimated ridership by station (top 10, 95% CI):")
+        _print_estimates(top)
         
-        color_ridership.plot(kind='bar', color=bar_colors)
-        plt.title('Ridership by Line Color')
-        plt.xlabel('Line Color')
-        plt.ylabel('Number of Riders')
+        plt.figure(figsize=(12, 8))
+        top = top.iloc[::-1]
+        plt.barh(top.index, top['estimate'], xerr=1.96 * top['stderr'])
+        plt.title('Top 10 Stations by Ridership (preview, 95% CI)')
+        plt.xlabel('Estimated Number of Riders')
         plt.tight_layout()
         # Save figure to file
-        filename = f"{output_dir}/domain_line_color.png"
+        filename = f"{output_dir}/preview_top10_stations.png"
         plt.savefig(filename)
         print(f"Saved plot to {filename}")
         plt.close()
+        
+        # Station by day type heatmap for the top stations
+        if 'Type_of_Day' in sample.columns:
+            station_day = estimate_totals(sample, ['Station_Name', 'Type_of_Day'])
+            station_day = station_day[station_day.index.get_level_values('Station_Name').isin(top.index)]
+            _plot_preview_heatmap(station_day, 'Ridership by Station and Day Type (preview)',
+                                  'preview_station_day_type.png')
+    
+    # Year by month heatmap
+    if 'Year' in sample.columns and 'Month' in sample.columns:
+        year_month = estimate_totals(sample, ['Year', 'Month'])
+        _plot_preview_heatmap(year_month, 'Ridership by Year and Month (preview)',
+                              'preview_year_month.png')
+    
+    print(f"\nPreview complete in {time.perf_counter() - start:.2f} s")
+
+def _plot_preview_heatmap(totals, title, name):
+    """Heatmap of estimated totals, printing the widest relative error"""
+    estimates = totals['estimate'].unstack()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = (1.96 * totals['stderr'] / totals['estimate']).replace([np.inf, -np.inf], np.nan)
+    print(f"\n{title}:")
+    print(estimates.round())
+    if relative.notna().any():
+        print(f"  95% CI half-width: median {relative.median() * 100:.1f}%, max {relative.max() * 100:.1f}% of the estimate")
+    
+    plt.figure(figsize=(12, 8))
+    sns.heatmap(estimates, annot=True, fmt='.0f', cmap='viridis')
+    plt.title(title)
+    plt.tight_layout()
+    # Save figure to file
+    filename = f"{output_dir}/{name}"
+    plt.savefig(filename)
+    print(f"Saved plot to {filename}")
+    plt.close()
 
 #############################################################
 # Main Execution
 #############################################################
 
+def parse_args():
+    """Parse command line options for the analysis"""
+    parser = argparse.ArgumentParser(description='CTA Tracker Data Analysis')
+    parser.add_argument('--profile', action='store_true',
+                        help='stream the combined file in chunks and print a one-pass profile only')
+    parser.add_argument('--chunksize', type=int, default=500000,
+                        help='rows per chunk for streaming modes (default: 500000)')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='compute the bivariate, multivariate and domain analyses chunk by chunk')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes used to aggregate chunks in out-of-core mode (default: 1)')
+    parser.add_argument('--memory', action='store_true',
+                        help='record peak RSS and top allocators for each stage')
+    parser.add_argument('--preview', action='store_true',
+                        help='run a fast approximate preview on a sample of the data')
+    parser.add_argument('--sample-frac', type=float, default=0.05,
+                        help='fraction of each station/day type stratum to sample in preview mode (default: 0.05)')
+    parser.add_argument('--sample-size', type=int,
+                        help='use a uniform reservoir sample of this many rows in preview mode instead')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for preview sampling (default: 0)')
+    parser.add_argument('--data',
+                        help=f'combined CSV file or partitioned directory (default: {data_file}, '
+                             f'or {partitioned_dir}/ if the file is absent)')
+    parser.add_argument('--years', type=parse_years,
+                        help="only analyse these years, e.g. '2022-2023' or '2019,2021'")
+    parser.add_argument('--lines', type=lambda text: set(text.split(',')),
+                        help="only analyse these line colors, e.g. 'Red,Blue'")
+    return parser.parse_args()
+
 def main():
     """Main function to execute the analysis"""
+    args = parse_args()
+    if args.data is None:
+        args.data = data_file if os.path.exists(data_file) else partitioned_dir
+    
+    # Check if the combined file (or its partitioned layout) exists
+    if not os.path.exists(args.data):
+        print(f"Error: {args.data} not found.")
+        exit(1)
+    print(f"Loading data from {args.data}...")
+    
+    tracker = MemoryTracker(enabled=args.memory)
     try:
+        if args.profile:
+            with tracker.stage('streaming profile'):
+                profile_data_streaming(args.data, chunksize=args.chunksize,
+                                       years=args.years, lines=args.lines)
+            return
+
+        if args.preview:
+            with tracker.stage('preview analysis'):
+                preview_analysis(args.data, frac=args.sample_frac, size=args.sample_size,
+                                 chunksize=args.chunksize, seed=args.seed,
+                                 years=args.years, lines=args.lines)
+            print("\nAnalysis complete!")
+            return
+
+        if args.out_of_core:
+            with tracker.stage('out-of-core analysis'):
+                out_of_core_analysis(args.data, chunksize=args.chunksize, workers=args.workers,
+                                     years=args.years, lines=args.lines)
+            print("\nAnalysis complete!")
+            return
+
         # Load the data
-        df = pd.read_csv(data_file)
+        with tracker.stage('load'):
+            df = load_data(args.data, years=args.years, lines=args.lines)
         print(f"Successfully loaded data with {df.shape[0]} rows and {df.shape[1]} columns.")
         
         # 1. Data Understanding
         print("\n=== DATA UNDERSTANDING ===")
-        examine_data_structure(df)
-        check_missing_values(df)
-        understand_variables(df)
+        with tracker.stage('examine data structure'):
+            examine_data_structure(df)
+        with tracker.stage('check missing values'):
+            check_missing_values(df)
+        with tracker.stage('understand variables'):
+            understand_variables(df)
         
         # 2. Data Cleaning
         print("\n=== DATA CLEANING ===")
-        df = handle_missing_values(df)
-        df = fix_data_types(df)
-        df = remove_unnecessary_columns(df)
+        df = apply_cleaning_spec(df, tracker=tracker)
+        with tracker.stage('derived columns'):
+            df = remove_unnecessary_columns(df)
         
         # 3. Exploratory Analysis
         print("\n=== EXPLORATORY ANALYSIS ===")
@@ -423,21 +1122,30 @@ def main():
         print("3. Multivariate Analysis")
         print("4. Domain-Specific Analysis")
         print("5. All Analyses")
+        print("6. Next-Month Ridership Forecast")
         print("0. Exit")
         
-        choice = input("Enter your choice (0-5): ")
+        choice = input("Enter your choice (0-6): ")
         
         if choice == '1' or choice == '5':
-            univariate_analysis(df)
+            with tracker.stage('univariate analysis'):
+                univariate_analysis(df)
         
         if choice == '2' or choice == '5':
-            bivariate_analysis(df)
+            with tracker.stage('bivariate analysis'):
+                bivariate_analysis(df)
         
         if choice == '3' or choice == '5':
-            multivariate_analysis(df)
+            with tracker.stage('multivariate analysis'):
+                multivariate_analysis(df)
         
         if choice == '4' or choice == '5':
-            domain_specific_analysis(df)
+            with tracker.stage('domain-specific analysis'):
+                domain_specific_analysis(df, lines_filtered=args.lines is not None)
+        
+        if choice == '6':
+            with tracker.stage('forecast'):
+                forecast_next_month(df)
         
         if choice == '0':
             print("Exiting analysis.")
@@ -446,6 +1154,8 @@ def main():
         
     except Exception as e:
         print(f"Error during analysis: {e}")
+    finally:
+        tracker.report()
 
 # Execute the main function if this script is run directly
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+# CTA Tracker - Memory Instrumentation
+# Opt-in per-stage memory report for the pandas pipelines: RSS before/after each
+# stage, the peak RSS within the stage (on Linux; the process lifetime peak
+# elsewhere), the tracemalloc peak within the stage and the source lines that
+# allocated the most memory. Stages may be nested.
+
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def current_rss():
+    """Current resident set size in bytes, or None if it can't be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def peak_rss():
+    """Peak resident set size in bytes since the last reset_peak_rss(), or None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS (Linux only); returns False if not possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _mb(value):
+    return "n/a" if value is None else f"{value / 1024 ** 2:,.1f}"
+
+
+class MemoryTracker:
+    """Records memory usage per named stage; does nothing unless enabled"""
+
+    def __init__(self, enabled=False, top=3):
+        self.enabled = enabled
+        self.top = top
+        self.stages = []
+        # Peaks of the stages currently open, so nested stages don't lose the
+        # outer stage's peak when they reset the counters
+        self._open = []
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @staticmethod
+    def _snapshot():
+        # Leave out tracemalloc's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def _fold_into_parent(self):
+        """Record the counters' current peaks on the enclosing stage before they are reset"""
+        if self._open:
+            parent = self._open[-1]
+            parent['traced_peak'] = max(parent['traced_peak'], tracemalloc.get_traced_memory()[1])
+            parent['rss_peak'] = max(parent['rss_peak'] or 0, peak_rss() or 0) or None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        self._fold_into_parent()
+        rss_before = current_rss()
+        peak_before = peak_rss()
+        stage_peak = reset_peak_rss()
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        snapshot_before = self._snapshot()
+        frame = {'traced_peak': 0, 'rss_peak': None}
+        self._open.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._open.pop()
+            # Read RSS and its peak together, before the snapshot allocates,
+            # so the peak is never below RSS after
+            rss_after = current_rss()
+            peak_after = max(peak_rss() or 0, frame['rss_peak'] or 0, rss_after or 0) or None
+            traced_after, traced_peak = tracemalloc.get_traced_memory()
+            traced_peak = max(traced_peak, frame['traced_peak'])
+            snapshot_after = self._snapshot()
+            allocators = [
+                stat for stat in snapshot_after.compare_to(snapshot_before, 'lineno')
+                if stat.size_diff > 0
+            ][:self.top]
+            if stage_peak:
+                # Peak within the stage, and how far it rose above the starting RSS
+                peak_increase = None if peak_after is None or rss_before is None else peak_after - rss_before
+            else:
+                # Process lifetime peak, and how much this stage raised it
+                peak_increase = None if peak_after is None or peak_before is None else peak_after - peak_before
+            self.stages.append({
+                'name': name,
+                'seconds': elapsed,
+                'rss_before': rss_before,
+                'rss_after': rss_after,
+                'peak_rss': peak_after,
+                'peak_increase': peak_increase,
+                'stage_peak': stage_peak,
+                'traced_delta': traced_after - traced_before,
+                'traced_peak': traced_peak - traced_before,
+                'allocators': allocators,
+            })
+            # Let an enclosing stage see this stage's peaks
+            if self._open:
+                parent = self._open[-1]
+                parent['traced_peak'] = max(parent['traced_peak'], traced_peak)
+                parent['rss_peak'] = max(parent['rss_peak'] or 0, peak_after or 0) or None
+
+    def report(self):
+        """Print the per-stage memory report"""
+        if not self.enabled:
+            return
+
+        print("\n=== MEMORY REPORT (MB) ===")
+        print(f"{'Stage':<32} {'Time (s)':>9} {'RSS before':>11} {'RSS after':>10} "
+              f"{'Peak RSS':>10} {'Peak +':>8} {'Traced +/-':>11} {'Traced peak':>12}")
+        for stage in self.stages:
+            marker = '' if stage['stage_peak'] else '*'
+            print(f"{stage['name'][:32]:<32} {stage['seconds']:>9.2f} {_mb(stage['rss_before']):>11} "
+                  f"{_mb(stage['rss_after']):>10} {_mb(stage['peak_rss']) + marker:>10} "
+                  f"{_mb(stage['peak_increase']):>8} {_mb(stage['traced_delta']):>11} {_mb(stage['traced_peak']):>12}")
+        if all(stage['stage_peak'] for stage in self.stages):
+            print("Peak RSS is the peak within each stage; Peak + is how far it rose above RSS before.")
+        else:
+            print("* Peak RSS could not be reset per stage, so it is the process lifetime peak;")
+            print("  Peak + is how much the stage raised that lifetime peak.")
+
+        print("\nTop allocators per stage:")
+        for stage in self.stages:
+            if not stage['allocators']:
+                continue
+            print(f"  {stage['name']}:")
+            for stat in stage['allocators']:
+                frame = stat.traceback[0]
+                print(f"    +{_mb(stat.size_diff)} MB  {frame.filename}:{frame.lineno}")
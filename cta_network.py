@@ -0,0 +1,135 @@
+# CTA Tracker - Transit Network Index
+# The line/stop/station tables are small and rarely change, so they are loaded
+# once into dictionaries and line lookups no longer need multi-way SQL joins
+
+import csv
+import os
+
+
+def _to_bool(value):
+    """Read an ADA flag stored as 0/1, True/False or their string forms"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+class TransitNetwork:
+    """In-memory index of CTA lines, stops and stations"""
+
+    def __init__(self, lines, stations, stops, stop_details):
+        # lines: (Line_ID, Color)
+        # stations: (Station_ID, Station_Name)
+        # stops: (Stop_ID, Station_ID, Stop_Name, Direction, ADA, Latitude, Longitude)
+        # stop_details: (Stop_ID, Line_ID)
+        line_colors = {str(line_id): color for line_id, color in lines}
+        self.station_names = {str(station_id): name for station_id, name in stations}
+
+        # stop -> stop record and stop -> station
+        self.stops = {}
+        self.stop_station = {}
+        for stop_id, station_id, stop_name, direction, ada, latitude, longitude in stops:
+            stop_id, station_id = str(stop_id), str(station_id)
+            self.stops[stop_id] = {
+                'Stop_Name': stop_name,
+                'Station_ID': station_id,
+                'Direction': direction,
+                'ADA': _to_bool(ada),
+                'Latitude': float(latitude),
+                'Longitude': float(longitude),
+            }
+            self.stop_station[stop_id] = station_id
+
+        # line -> stops (ordered by stop name) and station -> lines
+        self.line_stops = {}
+        self.station_lines = {}
+        for stop_id, line_id in stop_details:
+            stop_id = str(stop_id)
+            color = line_colors.get(str(line_id))
+            if color is None or stop_id not in self.stops:
+                continue
+            self.line_stops.setdefault(color, []).append(stop_id)
+            station_id = self.stop_station[stop_id]
+            self.station_lines.setdefault(station_id, set()).add(color)
+        for stop_ids in self.line_stops.values():
+            stop_ids.sort(key=lambda stop_id: self.stops[stop_id]['Stop_Name'])
+
+    @classmethod
+    def from_db(cls, dbConn):
+        """Build the index from the CTA SQLite database"""
+        dbCursor = dbConn.cursor()
+        dbCursor.execute("SELECT Line_ID, Color FROM Lines;")
+        lines = dbCursor.fetchall()
+        dbCursor.execute("SELECT Station_ID, Station_Name FROM Stations;")
+        stations = dbCursor.fetchall()
+        dbCursor.execute("SELECT Stop_ID, Station_ID, Stop_Name, Direction, ADA, Latitude, Longitude FROM Stops;")
+        stops = dbCursor.fetchall()
+        dbCursor.execute("SELECT Stop_ID, Line_ID FROM StopDetails;")
+        stop_details = dbCursor.fetchall()
+        dbCursor.close()
+        return cls(lines, stations, stops, stop_details)
+
+    @classmethod
+    def from_csv(cls, data_dir):
+        """Build the index from Lines.csv, Stations.csv, Stops.csv and StopDetails.csv"""
+        def read(name, columns):
+            with open(os.path.join(data_dir, name), newline='') as f:
+                return [tuple(row[col] for col in columns) for row in csv.DictReader(f)]
+
+        return cls(
+            read('Lines.csv', ['Line_ID', 'Color']),
+            read('Stations.csv', ['Station_ID', 'Station_Name']),
+            read('Stops.csv', ['Stop_ID', 'Station_ID', 'Stop_Name', 'Direction', 'ADA', 'Latitude', 'Longitude']),
+            read('StopDetails.csv', ['Stop_ID', 'Line_ID']),
+        )
+
+    def stops_on_line(self, color):
+        """Stops served by a line, ordered by stop name"""
+        return [self.stops[stop_id] for stop_id in self.line_stops.get(color, [])]
+
+    def stations_on_line(self, color):
+        """Distinct (station name, latitude, longitude) served by a line, ordered by stop name"""
+        seen = []
+        for stop in self.stops_on_line(color):
+            entry = (self.station_names.get(stop['Station_ID']), stop['Latitude'], stop['Longitude'])
+            if entry not in seen:
+                seen.append(entry)
+        return seen
+
+    def lines_at_station(self, station_id):
+        """Line colors serving a station"""
+        return sorted(self.station_lines.get(str(station_id), ()))
+
+    def line_ridership(self, station_totals):
+        """Split per-station totals from the combined dataset across line colors.
+
+        The combined dataset repeats every ridership row once per (stop, line)
+        pair at a station, so each station total is shared out in proportion
+        to that station's stop/line pairs on each line. Rows for stops that
+        serve no line are not attributed to any line. Grouping the cleaned
+        rows by Color differs there, because cleaning mode-fills their Color.
+
+        The totals must come from the unfiltered combined data. After
+        filtering rows by line, a station total no longer covers all of the
+        station's (stop, line) rows, so group by Color instead.
+        """
+        pairs = {}
+        for color, stop_ids in self.line_stops.items():
+            for stop_id in stop_ids:
+                key = (self.stop_station[stop_id], color)
+                pairs[key] = pairs.get(key, 0) + 1
+        # Stops without any line still contribute one (colorless) row each
+        stop_lines = {}
+        for stop_ids in self.line_stops.values():
+            for stop_id in stop_ids:
+                stop_lines[stop_id] = stop_lines.get(stop_id, 0) + 1
+        station_pairs = {}
+        for stop_id, station_id in self.stop_station.items():
+            station_pairs[station_id] = station_pairs.get(station_id, 0) + max(stop_lines.get(stop_id, 0), 1)
+
+        totals = {}
+        for (station_id, color), count in pairs.items():
+            riders = station_totals.get(station_id)
+            if riders is None:
+                continue
+            totals[color] = totals.get(color, 0) + riders * count / station_pairs[station_id]
+        return totals
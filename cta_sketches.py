@@ -0,0 +1,95 @@
+# CTA Tracker - Streaming Sketches
+# Small mergeable summaries used to profile data that is read in chunks:
+# approximate distinct counts and approximate quantiles
+
+import numpy as np
+import pandas as pd
+
+
+class HyperLogLog:
+    """Approximate distinct counter with mergeable registers"""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, series):
+        values = series.dropna()
+        if len(values) == 0:
+            return
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            # int64 1 and float64 1.0 hash differently, and a chunk's dtype depends
+            # on whether it happens to contain NaN, so hash every number as float64
+            values = values.astype('float64')
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # Rank = leading zeros + 1 in the next 32 bits (exact in float64)
+        rest = ((hashes >> np.uint64(32 - self.p)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        rank = np.full(len(rest), 33, dtype=np.uint8)
+        nonzero = rest > 0
+        rank[nonzero] = 32 - np.floor(np.log2(rest[nonzero])).astype(np.uint8)
+        best = pd.Series(rank).groupby(idx).max()
+        slots = best.index.to_numpy()
+        self.registers[slots] = np.maximum(self.registers[slots], best.to_numpy())
+
+    def merge(self, other):
+        self.registers = np.maximum(self.registers, other.registers)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * self.m and zeros > 0:
+            # Small-range correction (linear counting)
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """Mergeable compactor sketch for approximate quantiles (KLL-style)"""
+
+    def __init__(self, k=2048, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        for h, items in enumerate(other.levels):
+            if h >= len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # Keep one item back on odd lengths so total weight is preserved
+                leftover = items[-1:] if len(items) % 2 else items[:0]
+                items = items[:len(items) - len(leftover)]
+                promoted = items[self.rng.integers(2)::2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                self.levels[h] = leftover
+            h += 1
+
+    def quantiles(self, qs):
+        items = np.concatenate(self.levels)
+        if len(items) == 0:
+            return [np.nan for _ in qs]
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cumulative = items[order], np.cumsum(weights[order])
+        targets = np.asarray(qs) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, targets), len(items) - 1)
+        return items[positions].tolist()
@@ -1,5 +1,84 @@
 import sqlite3
+import csv
+import os
+import sys
+import time
+from collections import deque, OrderedDict
 import matplotlib.pyplot as plt
+from cta_network import TransitNetwork
+
+
+##################################################################  
+#
+# QueryCache
+#
+# LRU cache of query results keyed on (sql, parameters), shared by
+# the command functions. The whole cache is dropped whenever the
+# database may have changed: SQLite's PRAGMA data_version (writes by
+# other connections), this connection's total_changes, or the size
+# and modification time of the database file (and its WAL).
+#
+class QueryCache:
+  def __init__(self, maxsize=128):
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.version = None
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+
+  def _data_version(self, dbConn):
+    data_version = dbConn.execute("PRAGMA data_version;").fetchone()[0]
+    fingerprint = []
+    for row in dbConn.execute("PRAGMA database_list;"):
+      path = row[2]
+      if not path:
+        continue
+      for name in (path, path + '-wal'):
+        try:
+          st = os.stat(name)
+        except OSError:
+          continue
+        fingerprint.append((name, st.st_mtime_ns, st.st_size))
+    return (data_version, dbConn.total_changes, tuple(fingerprint))
+
+  def query(self, dbConn, sql, params=()):
+    version = self._data_version(dbConn)
+    if version != self.version:
+      if self.entries:
+        self.invalidations += 1
+        self.entries.clear()
+      self.version = version
+
+    key = (sql, tuple(params))
+    if key in self.entries:
+      self.hits += 1
+      self.entries.move_to_end(key)
+      return self.entries[key]
+
+    self.misses += 1
+    dbCursor = dbConn.cursor()
+    dbCursor.execute(sql, params)
+    rows = dbCursor.fetchall()
+    dbCursor.close()
+
+    if self.maxsize > 0:
+      self.entries[key] = rows
+      if len(self.entries) > self.maxsize:
+        self.entries.popitem(last=False)
+    return rows
+
+  def print_stats(self):
+    total = self.hits + self.misses
+    hit_rate = (self.hits / total * 100) if total > 0 else 0.0
+    print("Query cache:")
+    print(f"  entries: {len(self.entries)} / {self.maxsize}")
+    print(f"  hits: {self.hits:,}, misses: {self.misses:,} ({hit_rate:.1f}% hit rate)")
+    print(f"  invalidations: {self.invalidations:,}")
+
+
+# Size limit can be set with the CTA_QUERY_CACHE_SIZE environment variable (0 disables caching)
+query_cache = QueryCache(int(os.environ.get('CTA_QUERY_CACHE_SIZE', '128')))
 
 
 ##################################################################  
@@ -10,128 +89,233 @@ import matplotlib.pyplot as plt
 # SQL queries to retrieve and output basic stats.
 #
 def print_stats(dbConn):
-    dbCursor = dbConn.cursor()
-    
     print("General stats:")
     
-    dbCursor.execute("Select count(*) From Stations;")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select count(*) From Stations;")[0];
     print("  # of stations:", f"{row[0]:,}")
 
-    dbCursor.execute("Select count(*) From Stops;")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select count(*) From Stops;")[0];
     print("  # of stops:", f"{row[0]:,}")
 
-    dbCursor.execute("Select count(*) From Ridership;")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select count(*) From Ridership;")[0];
     print("  # of ride entries:", f"{row[0]:,}")
 
-    dbCursor.execute("SELECT strftime('%Y-%m-%d', MIN(Ride_Date)) FROM Ridership;")
-    row = dbCursor.fetchone();
-    dbCursor.execute("SELECT strftime('%Y-%m-%d', MAX(Ride_Date)) FROM Ridership;")
-    row2 = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "SELECT strftime('%Y-%m-%d', MIN(Ride_Date)) FROM Ridership;")[0];
+    row2 = query_cache.query(dbConn, "SELECT strftime('%Y-%m-%d', MAX(Ride_Date)) FROM Ridership;")[0];
     print("  date range:", row[0], " - ", row2[0]);
 
-    dbCursor.execute("Select SUM(Num_Riders) From Ridership;")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select SUM(Num_Riders) From Ridership;")[0];
     print("  Total ridership:", f"{row[0]:,}")
 
-    dbCursor.execute("Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'W';")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'W';")[0];
     print("  Weekday ridership:", f"{row[0]:,}", "({:0.2f}%)".format((row[0]/3377404512) * 100))
 
-    dbCursor.execute("Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'A';")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'A';")[0];
     print("  Saturday ridership:", f"{row[0]:,}", "({:0.2f}%)".format((row[0]/3377404512) * 100))
 
-    dbCursor.execute("Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'U';")
-    row = dbCursor.fetchone();
+    row = query_cache.query(dbConn, "Select SUM(Num_Riders) From Ridership WHERE Type_of_Day = 'U';")[0];
     print("  Sunday/holiday ridership:", f"{row[0]:,}", "({:0.2f}%)".format((row[0]/3377404512) * 100))
-  
+
+##################################################################  
+#
+# iter_rows
+#
+# Iterates over the results of an executed cursor in fetchmany
+# batches, so large results never have to be held in memory.
+#
+def iter_rows(dbCursor, batch_size=10000):
+  while True:
+    batch = dbCursor.fetchmany(batch_size)
+    if not batch:
+      break
+    for row in batch:
+      yield row
+
+
+##################################################################  
+#
+# stream_daily_series
+#
+# Reads a (Station_ID, Station_Name, date, Num_Riders) result and keeps
+# only the first and last 5 rows plus the ridership values.
+#
+def stream_daily_series(dbCursor, batch_size=10000):
+  head = []
+  tail = deque(maxlen=5)
+  riderships = []
+  for row in iter_rows(dbCursor, batch_size):
+    if len(head) < 5:
+      head.append(row)
+    tail.append(row)
+    riderships.append(row[3])
+  return head, list(tail), riderships
+
+
+##################################################################  
+#
+# export_query
+#
+# Executes a query and streams the results straight to a CSV file,
+# or to an Arrow IPC file when the path ends in .arrow/.feather
+# (requires pyarrow). Memory stays bounded by batch_size. For Arrow,
+# schema is a list of (column, type) pairs such as ('Num_Riders',
+# 'int64'); without it the types come from the first batch, with
+# all-NULL columns written as strings. A partially written file is
+# removed if the export fails. Returns the number of rows written.
+#
+def export_query(dbConn, sql, params, path, batch_size=10000, schema=None):
+  start = time.perf_counter()
+  arrow = path.endswith('.arrow') or path.endswith('.feather')
+  if arrow:
+    try:
+      import pyarrow as pa
+    except ImportError:
+      print("**Arrow export requires pyarrow (pip install pyarrow)")
+      return 0
+
+  dbCursor = dbConn.cursor()
+  nrows = 0
+  completed = False
+  created = False  # only remove a file this call created
+  try:
+    dbCursor.execute(sql, params)
+    header = [col[0] for col in dbCursor.description]
+
+    if arrow:
+      arrow_schema = None
+      if schema is not None:
+        arrow_schema = pa.schema([pa.field(name, pa.type_for_alias(type_name)) for name, type_name in schema])
+      writer = None
+      try:
+        while True:
+          batch = dbCursor.fetchmany(batch_size)
+          if not batch:
+            break
+          columns = [list(col) for col in zip(*batch)]
+          if arrow_schema is None:
+            inferred = [pa.array(col) for col in columns]
+            arrow_schema = pa.schema([pa.field(name, pa.string() if pa.types.is_null(arr.type) else arr.type)
+                                      for name, arr in zip(header, inferred)])
+          if writer is None:
+            writer = pa.ipc.new_file(path, arrow_schema)
+            created = True
+          # Safe cast, so a value that doesn't fit the schema (e.g. 4.5 in an int64 column) raises instead of being truncated
+          arrays = [pa.array(col).cast(field.type) for col, field in zip(columns, arrow_schema)]
+          writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=arrow_schema))
+          nrows += len(batch)
+        if writer is None:
+          # Empty result: still write a file with the header's columns
+          writer = pa.ipc.new_file(path, arrow_schema or pa.schema([pa.field(name, pa.string()) for name in header]))
+          created = True
+      finally:
+        if writer is not None:
+          writer.close()
+    else:
+      with open(path, 'w', newline='') as f:
+        created = True
+        writer = csv.writer(f)
+        writer.writerow(header)
+        while True:
+          batch = dbCursor.fetchmany(batch_size)
+          if not batch:
+            break
+          writer.writerows(batch)
+          nrows += len(batch)
+    completed = True
+  finally:
     dbCursor.close()
+    if not completed and created and os.path.exists(path):
+      os.remove(path)
+
+  elapsed = time.perf_counter() - start
+  print(f"Exported {nrows:,} rows to {path} in {elapsed:.2f}s ({nrows / max(elapsed, 1e-9):,.0f} rows/s)")
+  return nrows
+
+
+##################################################################  
+#
+# export_daily_ridership
+#
+# Exports the daily ridership series of every station.
+#
+DAILY_RIDERSHIP_SCHEMA = [
+  ('Station_ID', 'int64'),
+  ('Station_Name', 'string'),
+  ('Ride_Date', 'string'),
+  ('Type_of_Day', 'string'),
+  ('Num_Riders', 'int64'),
+]
+
+def export_daily_ridership(dbConn, path):
+  sql = "SELECT CAST(Ridership.Station_ID AS INTEGER) AS Station_ID, Stations.Station_Name, strftime('%Y-%m-%d', Ride_Date) AS Ride_Date, Type_of_Day, CAST(Num_Riders AS INTEGER) AS Num_Riders FROM Ridership INNER JOIN Stations ON Ridership.Station_ID = Stations.Station_ID ORDER BY Ridership.Station_ID, Ride_Date;"
+  return export_query(dbConn, sql, [], path, schema=DAILY_RIDERSHIP_SCHEMA)
+
+def export_command(dbConn):
+  path = input("Export file name (.csv, .arrow or .feather): ")
+  if path == "":
+    print("**No file name given...")
+    return
+  try:
+    export_daily_ridership(dbConn, path)
+  except (OSError, ValueError, sqlite3.Error) as e:
+    # ValueError covers Arrow conversion errors (pyarrow.ArrowInvalid)
+    print(f"**Export failed: {e}")
+
 
 def find_stations(dbConn):
-  dbCursor = dbConn.cursor();
   stationName = input("Enter partial station name (wildcards _ and %): ");
   
   if '_' in stationName or '%' in stationName:
       # Execute SQL query with parameterized value
       sql = "SELECT * FROM Stations WHERE Station_Name LIKE ? ORDER BY Station_Name ASC;";
-      dbCursor.execute(sql, [stationName]);
       # Output station names in ascending order
-      for row in dbCursor.fetchall():
+      for row in query_cache.query(dbConn, sql, [stationName]):
           print(row[0], ":", row[1]);
   else:
     print("**No stations found...");
-    
-  dbCursor.close()
 
 def find_all_ridership(dbConn):
-  dbCursor = dbConn.cursor();
-  
   print("** ridership all stations **");
   sql = "SELECT Stations.Station_Name, SUM(Ridership.Num_Riders) FROM Ridership INNER JOIN Stations ON Stations.Station_ID = Ridership.Station_ID GROUP BY Station_Name ORDER BY Station_Name ASC;"
-  dbCursor.execute(sql);
       # Output station names in ascending order
-  for row in dbCursor.fetchall():
+  for row in query_cache.query(dbConn, sql):
     percentage = (row[1]/3377404512) * 100;
     print(row[0], ":", "{:,}".format(row[1]), f"({percentage:.2f}%)");
 
-  dbCursor.close()
-
 def find_top_ridership(dbConn):
-  dbCursor = dbConn.cursor();
-  
   print("** top-10 stations **");
   sql = "SELECT Stations.Station_Name, SUM(Ridership.Num_Riders) FROM Ridership INNER JOIN Stations ON Stations.Station_ID = Ridership.Station_ID GROUP BY Station_Name ORDER BY SUM(Ridership.Num_Riders) DESC LIMIT 10;"
-  dbCursor.execute(sql);
       
-  for row in dbCursor.fetchall():
+  for row in query_cache.query(dbConn, sql):
     percentage = (row[1]/3377404512) * 100;
     print(row[0], ":", "{:,}".format(row[1]), f"({percentage:.2f}%)");
 
-  dbCursor.close()
-
 def find_least_ridership(dbConn):
-  dbCursor = dbConn.cursor();
-  
   print("** least-10 stations **");
   sql = "SELECT Stations.Station_Name, SUM(Ridership.Num_Riders) FROM Ridership INNER JOIN Stations ON Stations.Station_ID = Ridership.Station_ID GROUP BY Station_Name ORDER BY SUM(Ridership.Num_Riders) ASC LIMIT 10;"
-  dbCursor.execute(sql);
       
-  for row in dbCursor.fetchall():
+  for row in query_cache.query(dbConn, sql):
     percentage = (row[1]/3377404512) * 100;
     print(row[0], ":", "{:,}".format(row[1]), f"({percentage:.2f}%)");
 
-  dbCursor.close()
-
-def find_line_color(dbConn):
-  dbCursor = dbConn.cursor();
-  
+def find_line_color(network):
   line_color = input("Enter a line color (e.g. Red or Yellow): ").lower().capitalize();
-  sql = "SELECT Stops.Stop_Name, Stops.Direction, Stops.ADA FROM Stops INNER JOIN StopDetails ON Stops.Stop_ID = StopDetails.Stop_ID INNER JOIN Lines ON StopDetails.Line_ID = Lines.Line_ID WHERE Lines.Color = ? ORDER BY Stops.Stop_Name ASC;"
-  dbCursor.execute(sql, [line_color]);
-  rows = dbCursor.fetchall();
+  rows = network.stops_on_line(line_color);
   
   if len(rows) > 0:
     for result in rows:
-        stop_name = result[0]
-        direction = result[1]
-        ada = result[2]
+        stop_name = result['Stop_Name']
+        direction = result['Direction']
+        ada = result['ADA']
         acc_str = 'yes' if ada else 'no'
         print(f"{stop_name} : direction = {direction} (accessible? {acc_str})")
   else:
     print("No such line...")
 
-  dbCursor.close()
-
 def find_ridership_month_plot(dbConn):
-  dbCursor = dbConn.cursor();
-  
   sql = "SELECT strftime('%m', Ride_Date) AS Month, SUM(Num_Riders) FROM Ridership GROUP BY Month ORDER BY Month ASC;"
   
-  dbCursor.execute(sql);
-  rows = dbCursor.fetchall();
+  rows = query_cache.query(dbConn, sql);
 
   months = []
   riderships = []
@@ -152,15 +336,10 @@ def find_ridership_month_plot(dbConn):
       plt.plot(months, riderships)
       plt.show()
 
-  dbCursor.close()
-
 def find_ridership_year_plot(dbConn):
-  dbCursor = dbConn.cursor();
-  
   sql = "SELECT strftime('%Y', Ride_Date) AS Year, SUM(Num_Riders) FROM Ridership GROUP BY Year ORDER BY Year ASC;"
   
-  dbCursor.execute(sql);
-  rows = dbCursor.fetchall();
+  rows = query_cache.query(dbConn, sql);
 
   years = []
   riderships = []
@@ -181,8 +360,6 @@ def find_ridership_year_plot(dbConn):
     plt.plot(years, riderships)
     plt.show()
 
-  dbCursor.close()
-
 
 def find_ridership_two_year_plot(dbConn):
   dbCursor = dbConn.cursor();
@@ -193,7 +370,7 @@ def find_ridership_two_year_plot(dbConn):
   if '_' in station1_name or '%' in station1_name:
     query1 = "SELECT Ridership.Station_ID, Stations.Station_Name, strftime('%Y-%m-%d',Ride_Date), Num_Riders FROM Ridership INNER JOIN Stations ON Ridership.Station_ID = Stations.Station_ID WHERE strftime('%Y',Ride_Date) = ? and Station_Name LIKE ?";
     dbCursor.execute(query1, [year, station1_name])
-    station1_data = dbCursor.fetchall()
+    station1_head, station1_tail, riderships = stream_daily_series(dbCursor)
   else:
     print("**No stations found...");
 
@@ -202,68 +379,44 @@ def find_ridership_two_year_plot(dbConn):
   if '_' in station2_name or '%' in station2_name:
     query2 = "SELECT Ridership.Station_ID, Stations.Station_Name, strftime('%Y-%m-%d',Ride_Date), Num_Riders FROM Ridership INNER JOIN Stations ON Ridership.Station_ID = Stations.Station_ID WHERE strftime('%Y',Ride_Date) = ? and Station_Name LIKE ?";
     dbCursor.execute(query2, [year, station2_name])
-    station2_data = dbCursor.fetchall()
+    station2_head, station2_tail, riderships1 = stream_daily_series(dbCursor)
     # Print data for stations
-    if len(station1_data) > 0:
-      print('Station 1:', station1_data[0][0], station1_data[0][1])
-      for row in station1_data[:5]:
+    if len(station1_head) > 0:
+      print('Station 1:', station1_head[0][0], station1_head[0][1])
+      for row in station1_head:
           print(row[2], row[3])
-      for row in station1_data[-5:]:
+      for row in station1_tail:
           print(row[2], row[3])
 
-    if len(station2_data) > 0:
-      print('Station 2:', station2_data[0][0], station2_data[0][1])
-      for row in station2_data[:5]:
+    if len(station2_head) > 0:
+      print('Station 2:', station2_head[0][0], station2_head[0][1])
+      for row in station2_head:
           print(row[2], row[3])
-      for row in station2_data[-5:]:
+      for row in station2_tail:
           print(row[2], row[3])
     
-    rYears = []
-    riderships = []
-    anum = 0;
-    if len(station1_data) > 0:
-      for result in station1_data:
-          year = anum
-          ridership = result[3]
-          rYears.append(year)
-          riderships.append(ridership)
-          anum += 1
-
-    rYears1 = []
-    riderships1 = []
-    anum = 0
-    if len(station2_data) > 0:
-      for result in station2_data:
-          year1 = anum
-          ridership1 = result[3]
-          rYears1.append(year1)
-          riderships1.append(ridership1)
-          anum += 1
+    rYears = list(range(len(riderships)))
+    rYears1 = list(range(len(riderships1)))
     
     # Check if user wants to plot
     plot = input('Plot? (y/n) ')
   
     if plot == 'y':
-      plt.title('Daily Ridership at ' + station1_data[0][1] + ' and ' + station2_data[0][1] + ' for ' + nyear)
+      plt.title('Daily Ridership at ' + station1_head[0][1] + ' and ' + station2_head[0][1] + ' for ' + nyear)
       plt.xlabel('Date')
       plt.ylabel('Ridership')
       plt.plot(rYears, riderships)
       plt.plot(rYears1, riderships1)
-      plt.legend(['Ridership at ' + station1_data[0][1], 'Ridership at ' + station2_data[0][1]])
+      plt.legend(['Ridership at ' + station1_head[0][1], 'Ridership at ' + station2_head[0][1]])
       plt.show()
   else:
     print("**No stations found...");
     
   dbCursor.close()
 
-def find_station_location(dbConn):
-  dbCursor = dbConn.cursor();
+def find_station_location(network):
   line_color = input('Enter a line color (e.g. Red or Yellow): ').lower().capitalize();
-  
-  sql = "SELECT DISTINCT Stations.Station_Name, Stops.Latitude, Stops.Longitude FROM Stops INNER JOIN StopDetails ON StopDetails.Stop_ID = Stops.Stop_ID INNER JOIN Lines ON StopDetails.Line_ID = Lines.Line_ID INNER JOIN Stations ON Stations.Station_ID = Stops.Station_ID WHERE Lines.Color = ? ORDER BY Stops.Stop_Name ASC;"
-  
-  dbCursor.execute(sql, [line_color]);
-  rows = dbCursor.fetchall();
+  rows = network.stations_on_line(line_color);
 
   x = []
   y = []
@@ -307,21 +460,31 @@ def find_station_location(dbConn):
             
   else:
     print(f'No such line "{line_color}"...')
-
-  dbCursor.close()
 ##################################################################  
 #
 # main
 #
+dbConn = sqlite3.connect('CTA2_L_daily_ridership.db')
+
+# Batch mode: python main.py export <file.csv|file.arrow>
+if len(sys.argv) > 1 and sys.argv[1] == 'export':
+  if len(sys.argv) < 3:
+    print("usage: python main.py export <file.csv|file.arrow|file.feather>")
+    sys.exit(1)
+  export_daily_ridership(dbConn, sys.argv[2])
+  dbConn.close()
+  sys.exit(0)
+
 print('** Welcome to CTA L analysis app **')
 print()
 
-dbConn = sqlite3.connect('CTA2_L_daily_ridership.db')
-
 print_stats(dbConn)
 
+# Load lines, stops and stations once for the line lookups
+network = TransitNetwork.from_db(dbConn)
+
 while True:
-    command = input("Please enter a command (1-9, x to exit): ");
+    command = input("Please enter a command (1-10, c for cache stats, x to exit): ");
     if command == '1':
       find_stations(dbConn);
     elif command == '2':
@@ -331,7 +494,7 @@ while True:
     elif command == '4':
       find_least_ridership(dbConn);
     elif command == '5':
-      find_line_color(dbConn);
+      find_line_color(network);
     elif command == '6':
       find_ridership_month_plot(dbConn);
     elif command == '7':
@@ -339,7 +502,11 @@ while True:
     elif command == '8':
       find_ridership_two_year_plot(dbConn);
     elif command == '9':
-      find_station_location(dbConn);
+      find_station_location(network);
+    elif command == '10':
+      export_command(dbConn);
+    elif command == 'c':
+      query_cache.print_stats();
     elif command == 'x':
         break
     else:
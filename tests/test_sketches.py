@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cta_sketches import HyperLogLog, QuantileSketch
+
+
+def test_hyperloglog_matches_nunique_across_mixed_dtype_chunks():
+    # The same IDs arrive as int64 in one chunk and as float64 (because of a NaN) in another
+    chunks = [
+        pd.Series([1, 2, 3, 1, 2], dtype='int64'),
+        pd.Series([1.0, np.nan, 3.0, 2.0], dtype='float64'),
+        pd.Series([3, 3, 1], dtype='int64'),
+    ]
+    hll = HyperLogLog()
+    for chunk in chunks:
+        hll.update(chunk)
+
+    assert hll.count() == pd.concat(chunks).nunique() == 3
+
+
+def test_hyperloglog_merge_matches_nunique():
+    values = pd.Series(np.arange(5000) % 1200)
+    left, right = HyperLogLog(), HyperLogLog()
+    left.update(values[:2500])
+    right.update(values[2500:])
+    left.merge(right)
+
+    assert abs(left.count() - values.nunique()) <= 0.05 * values.nunique()
+
+
+def test_quantile_sketch_close_to_exact_quantiles():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=200000)
+    sketch = QuantileSketch(k=512)
+    for chunk in np.array_split(values, 20):
+        sketch.update(chunk)
+
+    approx = sketch.quantiles([0.25, 0.5, 0.75])
+    exact = np.quantile(values, [0.25, 0.5, 0.75])
+    assert np.allclose(approx, exact, atol=0.05)